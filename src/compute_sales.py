@@ -6,11 +6,49 @@ Actividad 5.2 – Ejercicio 2: Compute Sales con salida dinámica
 from __future__ import annotations
 
 import json
+import mmap
 import sys
 import time
-from dataclasses import dataclass
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain, islice
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import orjson
+    from orjson import loads as json_loads
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+    try:
+        from ujson import loads as json_loads
+    except ImportError:
+        from json import loads as json_loads
+
+try:
+    import ijson
+    STREAM_ERRORS: Tuple[type, ...] = (OSError, ValueError, ijson.JSONError)
+except ImportError:  # pragma: no cover - depende del entorno
+    ijson = None
+    STREAM_ERRORS = (OSError, ValueError)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depende del entorno
+    np = None
+
+# Desde este tamano el kernel se compila con Numba (import diferido).
+# Import + primera llamada cuestan ~0.3 s y el JIT ahorra ~1.5 ns por
+# renglon frente a NumPy: solo compensa cerca de 2e8 renglones
+PARALLEL_MIN = 200_000_000
+
+# Archivos desde este tamano se leen via mmap (sin copia)
+MMAP_MIN = 16 << 20
+
+# Desde este tamano las ventas se leen en streaming con ijson; por debajo
+# cargar todo con load_json es mas rapido
+STREAM_MIN = 256 << 20
 
 # Carpeta global para todos los resultados
 RESULTS_DIR = "results"
@@ -19,132 +57,386 @@ PRODUCT_KEYS = ("product", "Product", "title", "name", "item")
 PRICE_KEYS = ("price", "Price", "cost", "unit_price", "unitPrice")
 QTY_KEYS = ("quantity", "Quantity", "qty", "amount", "units")
 
-ReceiptLine = Tuple[str, float, float, float]
-
+# Formato de renglon del recibo (nombre truncado a 30)
+ROW_FMT = "{:30.30} {:10.2f} {:12.2f} {:14.2f}"
+
+# Recibo en columnas (SoA): productos, cantidades, precios, subtotales
+Receipt = Tuple[List[str], Any, Any, Any]
+
+# Error diferido: (codigo, indice, valor); se formatea al armar el reporte
+ErrorItem = Tuple[str, int, Any]
+
+ERR_FMT = {
+    "CAT_INVALID": "[Cat {}] Invalido",
+    "CAT_EMPTY": "[Cat {}] Vacio: {!r}",
+    "CAT_BAD_PRICE": "[Cat {}] Precio: {!r}",
+    "CAT_NONE": "Sin catalogo.",
+    "SALES_INVALID": "[Sales {}] Invalido",
+    "SALES_BAD_PROD": "[Sales {}] Invalido: {!r}",
+    "SALES_BAD_QTY": "[Sales {}] Cant: {!r}",
+    "SALES_QTY_LE0": "[Sales {}] Qty<=0: {}",
+    "SALES_NO_CAT": "[Sales {}] No cat: {}",
+    "SALES_NONE": "Sin ventas.",
+}
+
+# Texto con el que polars deja un producto no-string al forzar la columna
+# a String (numero, booleano, lista u objeto); esos archivos van por Python
+COERCED_RE = r"^(?:-?[0-9]|true$|false$|\[|\{)"
+
+# Centinela para dict.get: distingue "sin key" de un valor None
+_MISS = object()
+
+# Lector de ventas generado por archivo, con las keys detectadas fijas
+READER_SRC = """\
+def read(rec):
+    if not isinstance(rec, dict):
+        return None
+    prod = rec.get({prod_key!r}, miss)
+    if prod is miss:
+        prod = first_present(rec, product_keys)
+    qty = rec.get({qty_key!r}, miss)
+    if qty is miss:
+        qty = first_present(rec, qty_keys)
+    return prod, qty
+"""
 
-@dataclass(frozen=True)
-class SaleLine:
-    """Línea de venta."""
-    product: str
-    quantity: float
+# Cantidades y nombres se repiten mucho entre ventas: memoizar
+_cached_float = lru_cache(maxsize=1024)(float)
+_cached_strip = lru_cache(maxsize=4096)(str.strip)
 
 
 def load_json(path_str: str) -> Any:
-    """Carga JSON."""
+    """Carga JSON (orjson > ujson > json)."""
     path = Path(path_str)
-    with path.open("r", encoding="utf-8") as file:
-        return json.load(file)
+    if orjson is None or path.stat().st_size < MMAP_MIN:
+        return json_loads(path.read_bytes())
+    with path.open("rb") as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with memoryview(mapped) as view:
+            return json_loads(view)
 
 
 def first_present(data: Dict[str, Any], keys: Iterable[str]) -> Any:
     """Busca key."""
     for key in keys:
-        if key in data:
-            return data[key]
+        val = data.get(key, _MISS)
+        if val is not _MISS:
+            return val
     return None
 
 
+def detect_keys(record: Dict[str, Any], keys: Iterable[str]) -> Optional[str]:
+    """Detecta la key usada por el archivo."""
+    for key in keys:
+        if key in record:
+            return key
+    return None
+
+
+def key_order(sample: Any, keys: Tuple[str, ...]) -> List[str]:
+    """Orden en que make_reader prueba las keys: la de sample primero."""
+    first = detect_keys(sample, keys) if isinstance(sample, dict) else None
+    if first is None:
+        return list(keys)
+    return [first, *(key for key in keys if key != first)]
+
+
+def make_reader(sample: Any) -> Callable[[Any], Optional[Tuple[Any, Any]]]:
+    """Genera el lector (producto, cantidad) para el esquema de sample."""
+    prod_key = qty_key = None
+    if isinstance(sample, dict):
+        prod_key = detect_keys(sample, PRODUCT_KEYS)
+        qty_key = detect_keys(sample, QTY_KEYS)
+    # exec es seguro porque las keys solo salen de las tuplas constantes
+    # PRODUCT_KEYS / QTY_KEYS, nunca del archivo: mantener esa garantia
+    src = READER_SRC.format(prod_key=prod_key, qty_key=qty_key)
+    namespace = {
+        "miss": _MISS,
+        "first_present": first_present,
+        "product_keys": PRODUCT_KEYS,
+        "qty_keys": QTY_KEYS,
+    }
+    exec(compile(src, "<sales reader>", "exec"),  # pylint: disable=exec-used
+         namespace)
+    return namespace["read"]
+
+
+def read_sales(records: Iterable[Any]) -> Iterable[Any]:
+    """Aplica a cada venta el lector generado con la primera."""
+    records = iter(records)
+    head = list(islice(records, 1))
+    return map(make_reader(head[0] if head else None), chain(head, records))
+
+
 def to_float(value: Any) -> Optional[float]:
     """A float."""
+    if isinstance(value, (str, int)):
+        try:
+            return _cached_float(value)
+        except ValueError:
+            return None
     try:
         return float(value)
     except (TypeError, ValueError):
         return None
 
 
-def iter_records(obj: Any) -> Iterable[Any]:
-    """Itera registros."""
-    if isinstance(obj, list):
-        yield from obj
-        return
-    if isinstance(obj, dict):
+def as_records(raw: Any) -> List[Any]:
+    """Registros como lista, sin copiar la lista raiz o anidada."""
+    if isinstance(raw, list):
+        return raw
+    if isinstance(raw, dict):
         for key in ("items", "records", "sales", "data"):
-            val = obj.get(key)
+            val = raw.get(key)
             if isinstance(val, list):
-                yield from val
-                return
-        yield obj
-    return
+                return val
+        return [raw]
+    return []
 
 
-def build_catalogue(raw: Any) -> Tuple[Dict[str, float], List[str]]:
+def stream_sales(path_str: str) -> Iterable[Any]:
+    """Itera ventas; archivos grandes via ijson sin cargarlos completos."""
+    path = Path(path_str)
+    try:
+        if ijson is not None and path.stat().st_size >= STREAM_MIN:
+            with path.open("rb") as file:
+                head = file.read(64).lstrip()
+                if head.startswith(b"["):
+                    file.seek(0)
+                    yield from ijson.items(file, "item", use_float=True)
+                    return
+        yield from as_records(load_json(path_str))
+    except STREAM_ERRORS as exc:
+        raise RuntimeError(f"Err sales: {exc}") from exc
+
+
+def stream_ndjson(path_str: str) -> Iterable[Any]:
+    """Itera ventas NDJSON (un objeto por linea)."""
+    try:
+        with Path(path_str).open("rb") as file:
+            for line in file:
+                if line.strip():
+                    yield json_loads(line)
+    except (OSError, ValueError) as exc:
+        raise RuntimeError(f"Err sales: {exc}") from exc
+
+
+def build_catalogue(raw: Any) -> Tuple[Dict[str, float], List[ErrorItem]]:
     """Catálogo {prod: precio}."""
     errs, cat = [], {}
-    for idx, rec in enumerate(iter_records(raw), start=1):
+    for idx, rec in enumerate(as_records(raw), start=1):
         if not isinstance(rec, dict):
-            errs.append(f"[Cat {idx}] Invalido")
+            errs.append(("CAT_INVALID", idx, None))
             continue
         prod = first_present(rec, PRODUCT_KEYS)
         price = first_present(rec, PRICE_KEYS)
-        if not isinstance(prod, str) or not prod.strip():
-            errs.append(f"[Cat {idx}] Vacio: {prod!r}")
+        name = _cached_strip(prod) if isinstance(prod, str) else ""
+        if not name:
+            errs.append(("CAT_EMPTY", idx, prod))
             continue
         p_val = to_float(price)
         if p_val is None or p_val < 0:
-            errs.append(f"[Cat {idx}] Precio: {price!r}")
+            errs.append(("CAT_BAD_PRICE", idx, price))
             continue
-        cat[prod.strip()] = p_val
+        cat[name] = p_val
     if not cat:
-        errs.append("Sin catalogo.")
+        errs.append(("CAT_NONE", 0, None))
     return cat, errs
 
 
-def build_sales(raw: Any) -> Tuple[List[SaleLine], List[str]]:
-    """Extrae ventas."""
-    errs, lines = [], []
-    for idx, rec in enumerate(iter_records(raw), start=1):
-        if not isinstance(rec, dict):
-            errs.append(f"[Sales {idx}] Invalido")
+def _mul_sum(q_arr: Any, p_arr: Any) -> Tuple[Any, float]:
+    """Kernel: subtotales y total."""
+    subs = q_arr * p_arr
+    return subs, subs.sum()
+
+
+@lru_cache(maxsize=None)
+def _jit_mul_sum() -> Callable[[Any, Any], Tuple[Any, float]]:
+    """Compila _mul_sum con Numba (paralelo) la primera vez que se usa."""
+    try:
+        from numba import njit  # pylint: disable=import-outside-toplevel
+    except ImportError:  # pragma: no cover - depende del entorno
+        return _mul_sum
+    return njit(cache=True, fastmath=True, parallel=True)(_mul_sum)
+
+
+def price_receipt(
+    prods: List[str],
+    qtys: List[float],
+    slots: List[int],
+    catalogue: Dict[str, float],
+) -> Tuple[Receipt, float]:
+    """Subtotales y total; precios por posicion (slot) en el catalogo."""
+    if np is None:
+        cat_prices = list(catalogue.values())
+        q_arr = array("d", qtys)
+        p_arr = array("d", map(cat_prices.__getitem__, slots))
+        subs_arr = array("d", map(float.__mul__, q_arr, p_arr))
+        return (prods, q_arr, p_arr, subs_arr), sum(subs_arr, 0.0)
+    cat_prices = np.fromiter(catalogue.values(), dtype=np.float64,
+                             count=len(catalogue))
+    q_arr = np.fromiter(qtys, dtype=np.float64, count=len(qtys))
+    p_arr = cat_prices[np.fromiter(slots, dtype=np.intp, count=len(slots))]
+    if len(q_arr) > PARALLEL_MIN:
+        subs_arr, total = _jit_mul_sum()(q_arr, p_arr)
+    else:
+        subs_arr, total = _mul_sum(q_arr, p_arr)
+    return (prods, q_arr, p_arr, subs_arr), float(total)
+
+
+def stream_receipt(
+    catalogue: Dict[str, float],
+    records: Iterable[Any],
+) -> Tuple[Receipt, float, List[ErrorItem]]:
+    """Valida ventas y arma el recibo en una sola pasada."""
+    errs, prods, qtys, slots = [], [], [], []
+    index = {name: slot for slot, name in enumerate(catalogue)}
+    for idx, row in enumerate(read_sales(records), start=1):
+        if row is None:
+            errs.append(("SALES_INVALID", idx, None))
             continue
-        prod = first_present(rec, PRODUCT_KEYS)
-        qty = first_present(rec, QTY_KEYS)
-        if not isinstance(prod, str) or not prod.strip():
-            errs.append(f"[Sales {idx}] Invalido: {prod!r}")
+        prod, qty = row
+        name = _cached_strip(prod) if isinstance(prod, str) else ""
+        if not name:
+            errs.append(("SALES_BAD_PROD", idx, prod))
             continue
         q_val = to_float(qty)
         if q_val is None:
-            errs.append(f"[Sales {idx}] Cant: {qty!r}")
+            errs.append(("SALES_BAD_QTY", idx, qty))
+            continue
+        if q_val <= 0:
+            errs.append(("SALES_QTY_LE0", idx, q_val))
+            continue
+        slot = index.get(name)
+        if slot is None:
+            errs.append(("SALES_NO_CAT", idx, name))
             continue
-        lines.append(SaleLine(product=prod.strip(), quantity=q_val))
-    if not lines:
-        errs.append("Sin ventas.")
-    return lines, errs
+        prods.append(name)
+        qtys.append(q_val)
+        slots.append(slot)
+    if not prods:
+        errs.append(("SALES_NONE", 0, None))
+    return (*price_receipt(prods, qtys, slots, catalogue), errs)
 
 
-def compute_receipt(
+def polars_receipt(
     catalogue: Dict[str, float],
-    sales: List[SaleLine],
-) -> Tuple[List[ReceiptLine], float, List[str]]:
-    """Recibo."""
-    errs, receipt, total = [], [], 0.0
-    for idx, sale in enumerate(sales, start=1):
-        if sale.quantity <= 0:
-            errs.append(f"[Sales {idx}] Qty<=0: {sale.quantity}")
-            continue
-        if sale.product not in catalogue:
-            errs.append(f"[Sales {idx}] No cat: {sale.product}")
-            continue
-        u_p = catalogue[sale.product]
-        sub = u_p * sale.quantity
-        receipt.append((sale.product, sale.quantity, u_p, sub))
-        total += sub
-    return receipt, total, errs
+    sales_path: str,
+) -> Tuple[Receipt, float, List[ErrorItem]]:
+    """Recibo NDJSON con polars (lazy); si no aplica, ruta Python."""
+    rows = polars_rows(catalogue, sales_path)
+    if rows is None:
+        return stream_receipt(catalogue, stream_ndjson(sales_path))
+    return polars_columns(rows)
+
+
+def polars_rows(catalogue: Dict[str, float], sales_path: str) -> Any:
+    """Valida las ventas en polars; None si el archivo pide la ruta Python."""
+    try:
+        import polars as pl  # pylint: disable=import-outside-toplevel
+    except ImportError:  # pragma: no cover - depende del entorno
+        return None
+    try:
+        sample = next(iter(stream_ndjson(sales_path)), None)
+    except RuntimeError:
+        return None
+    try:
+        # Inferir con todo el archivo: aliases tardios tambien son columnas
+        sales = pl.scan_ndjson(sales_path, infer_schema_length=None)
+        schema = sales.collect_schema()
+        # Mismo orden que make_reader; solo difiere un null explicito,
+        # que polars no distingue de una key ausente
+        prod_cols = [k for k in key_order(sample, PRODUCT_KEYS) if k in schema]
+        qty_cols = [k for k in key_order(sample, QTY_KEYS) if k in schema]
+        if not prod_cols or not qty_cols or any(
+                schema[key] != pl.String for key in prod_cols):
+            return None
+        cat_df = pl.DataFrame(
+            {"name": list(catalogue), "unit": list(catalogue.values())},
+            schema={"name": pl.String, "unit": pl.Float64},
+        )
+        rows = (
+            sales.with_row_index("idx", offset=1)
+            .select(
+                "idx",
+                prod=pl.coalesce(prod_cols),
+                qty_raw=pl.coalesce(
+                    [pl.col(key).cast(pl.String) for key in qty_cols]),
+            )
+            .with_columns(
+                name=pl.col("prod").str.strip_chars(),
+                qty=pl.col("qty_raw").cast(pl.Float64, strict=False),
+            )
+            .join(cat_df.lazy(), on="name", how="left")
+            .with_columns(
+                code=pl.when(pl.col("name").fill_null("") == "")
+                .then(pl.lit("SALES_BAD_PROD"))
+                .when(pl.col("qty").is_null())
+                .then(pl.lit("SALES_BAD_QTY"))
+                .when(pl.col("qty") <= 0)
+                .then(pl.lit("SALES_QTY_LE0"))
+                .when(pl.col("unit").is_null())
+                .then(pl.lit("SALES_NO_CAT"))
+            )
+            .sort("idx")
+            .collect()
+        )
+    except (OSError, pl.exceptions.PolarsError):
+        return None
+    # Cantidades que polars no convierte se revisan con to_float
+    suspect = rows.filter(
+        pl.col("prod").str.contains(COERCED_RE)
+        | (pl.col("qty").is_null() & pl.col("qty_raw").is_not_null())
+    )
+    return None if len(suspect) else rows
+
+
+def polars_columns(rows: Any) -> Tuple[Receipt, float, List[ErrorItem]]:
+    """Separa renglones validos y errores de un DataFrame de polars."""
+    import polars as pl  # pylint: disable=import-outside-toplevel
+    values = {
+        "SALES_BAD_PROD": "prod", "SALES_BAD_QTY": "qty_raw",
+        "SALES_QTY_LE0": "qty", "SALES_NO_CAT": "name",
+    }
+    bad = rows.filter(pl.col("code").is_not_null())
+    errs = [
+        (code, idx, row[values[code]])
+        for code, idx, row in zip(bad["code"], bad["idx"],
+                                  bad.iter_rows(named=True))
+    ]
+    good = rows.filter(pl.col("code").is_null())
+    good = good.with_columns(sub=pl.col("qty") * pl.col("unit"))
+    if good.is_empty():
+        errs.append(("SALES_NONE", 0, None))
+    cols = [good[col] for col in ("qty", "unit", "sub")]
+    if np is None:
+        cols = [array("d", col.to_list()) for col in cols]
+    else:
+        cols = [col.to_numpy() for col in cols]
+    receipt = (good["name"].to_list(), *cols)
+    return receipt, float(good["sub"].sum()), errs
+
+
+def format_errors(errors: List[ErrorItem]) -> List[str]:
+    """Formatea los errores diferidos en un solo lote."""
+    return [ERR_FMT[code].format(idx, val) for code, idx, val in errors]
 
 
 def format_report(
-    receipt: List[ReceiptLine],
+    receipt: Receipt,
     total: float,
-    errors: List[str],
+    errors: List[ErrorItem],
     elapsed: float,
 ) -> str:
     """Reporte."""
     lines = ["=== SALES RECEIPT ==="]
-    if receipt:
+    prods, qtys, units, subs = receipt
+    if prods:
         header = f"{'Product':30} {'Qty':>10} {'Unit':>12} {'Subtotal':>14}"
         lines.append(header)
         lines.append("-" * 70)
-        for p, q, u, s in receipt:
-            lines.append(f"{p[:30]:30} {q:10.2f} {u:12.2f} {s:14.2f}")
+        lines.extend(map(ROW_FMT.format, prods, qtys.tolist(),
+                         units.tolist(), subs.tolist()))
         lines.append("-" * 70)
         lines.append(f"{'TOTAL':>54} {total:14.2f}")
     else:
@@ -152,49 +444,99 @@ def format_report(
     lines.append(f"\nElapsed (s): {elapsed:.6f}\n")
     if errors:
         lines.append("=== ERRORS ===")
-        lines.extend(errors)
+        lines.extend(format_errors(errors))
     return "\n".join(lines) + "\n"
 
 
+def format_report_json(
+    receipt: Receipt,
+    total: float,
+    errors: List[ErrorItem],
+    elapsed: float,
+) -> str:
+    """Reporte JSON (orjson serializa las columnas NumPy en C)."""
+    prods, qtys, units, subs = receipt
+    data = {
+        "receipt": {
+            "product": prods,
+            "quantity": qtys,
+            "unit": units,
+            "subtotal": subs,
+        },
+        "total": total,
+        "errors": format_errors(errors),
+        "elapsed": elapsed,
+    }
+    if orjson is not None:
+        # pylint: disable=no-member
+        opts = orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY
+        raw = orjson.dumps(data, default=list, option=opts)
+        return raw.decode() + "\n"
+    return json.dumps(data, default=list, indent=2) + "\n"
+
+
 def safe_load_json(path: str, label: str) -> Any:
     """Carga JSON."""
     try:
         return load_json(path)
     except (FileNotFoundError, PermissionError, OSError,
-            json.JSONDecodeError) as exc:
+            ValueError) as exc:
         msg = f"Err {label}: {exc}"
         raise RuntimeError(msg) from exc
 
 
-def save_results(sales_path: str, report_text: str) -> None:
+def load_inputs(
+    products_path: str,
+    sales_path: str,
+) -> Tuple[Dict[str, float], List[ErrorItem], Iterable[Any]]:
+    """Carga el catalogo en otro hilo mientras arrancan las ventas."""
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        cat_job = pool.submit(safe_load_json, products_path, "product")
+        sales = iter(stream_sales(sales_path))
+        try:
+            head = list(islice(sales, 1))
+        finally:
+            cat_raw = cat_job.result()
+    cat, c_err = build_catalogue(cat_raw)
+    return cat, c_err, chain(head, sales)
+
+
+def save_results(sales_path: str, report_text: str,
+                 suffix: str = ".txt") -> None:
     """Crea directorio y guarda el reporte con nombre dinamico."""
     output_dir = Path(RESULTS_DIR)
     output_dir.mkdir(exist_ok=True)
     sales_file_name = Path(sales_path).stem
-    result_path = output_dir / f"Results_{sales_file_name}.txt"
-    result_path.write_text(report_text, encoding="utf-8")
+    result_path = output_dir / f"Results_{sales_file_name}{suffix}"
+    result_path.write_bytes(report_text.encode("utf-8"))
 
 
 def main(argv: List[str]) -> int:
     """Main."""
     start = time.perf_counter()
+    as_json = "--json" in argv
+    as_ndjson = "--ndjson" in argv
+    argv = [arg for arg in argv if arg not in ("--json", "--ndjson")]
     if len(argv) != 3:
-        print("Usage: python src/compute_sales.py <p.json> <s.json>")
+        print("Usage: python src/compute_sales.py <p.json> <s.json> "
+              "[--json] [--ndjson]")
         return 2
     try:
-        cat_raw = safe_load_json(argv[1], "product")
-        sal_raw = safe_load_json(argv[2], "sales")
-        cat, c_err = build_catalogue(cat_raw)
-        sal, s_err = build_sales(sal_raw)
+        if as_ndjson:
+            cat, c_err = build_catalogue(safe_load_json(argv[1], "product"))
+            receipt, total, s_err = polars_receipt(cat, argv[2])
+        else:
+            cat, c_err, sales = load_inputs(argv[1], argv[2])
+            receipt, total, s_err = stream_receipt(cat, sales)
     except RuntimeError as exc:
         print(str(exc))
         return 1
 
-    receipt, total, calc_err = compute_receipt(cat, sal)
-    rep = format_report(receipt, total, c_err + s_err + calc_err,
-                        time.perf_counter() - start)
+    formatter = format_report_json if as_json else format_report
+    rep = formatter(receipt, total, c_err + s_err,
+                    time.perf_counter() - start)
     print(rep)
-    save_results(argv[2], rep)
+    save_results(argv[2], rep, ".json" if as_json else ".txt")
 
     return 0
 
@@ -0,0 +1,92 @@
+"""
+Pruebas: la ruta polars de --ndjson coincide con la ruta Python.
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+# pylint: disable-next=wrong-import-position,import-error
+import compute_sales  # noqa: E402
+
+pytest.importorskip("polars")
+
+CATALOGUE = {"A": 1.0, "B": 2.0, "C": 3.0}
+
+CASES = {
+    "aliases": [
+        {"product": "A", "quantity": 2},
+        {"name": "B", "quantity": "1"},
+        {"product": "C", "qty": 3},
+        {"product": " A ", "quantity": 1},
+        {"product": "Z", "quantity": 1},
+        {"product": "A", "quantity": -1},
+        {"product": "", "quantity": 1},
+        {"quantity": 1},
+        {"product": "B"},
+    ],
+    "numeric_product": [
+        {"product": "A", "quantity": 1},
+        {"product": 123, "quantity": 1},
+    ],
+    "non_object_line": [
+        {"product": "A", "quantity": 1},
+        [1, 2],
+        {"product": "B", "quantity": 2},
+    ],
+    "bad_quantity": [
+        {"product": "A", "quantity": "x"},
+        {"product": "B", "quantity": " 2 "},
+        {"product": "C", "quantity": True},
+    ],
+    "late_alias": (
+        [{"product": "A", "quantity": 1}] * 200
+        + [{"name": "B", "quantity": 2}, {"product": "C", "qty": 3}]
+    ),
+    "first_record_key": [
+        {"name": "A", "quantity": 1},
+        {"product": "B", "name": "A", "quantity": 2},
+    ],
+    "numeric_only": [
+        {"product": "A", "quantity": 1.5},
+        {"product": "B", "quantity": 4},
+    ],
+}
+
+
+def write_sales(tmp_path, case):
+    """Escribe el caso como NDJSON."""
+    sales = tmp_path / "sales.ndjson"
+    sales.write_text(
+        "\n".join(json.dumps(rec) for rec in CASES[case]) + "\n",
+        encoding="utf-8",
+    )
+    return sales
+
+
+def report(result):
+    """Reporte de texto sin tiempo."""
+    receipt, total, errors = result
+    return compute_sales.format_report(receipt, total, errors, 0.0)
+
+
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_ndjson_paths_match(tmp_path, case):
+    """Ambas rutas --ndjson producen el mismo reporte."""
+    sales = write_sales(tmp_path, case)
+    expected = compute_sales.stream_receipt(
+        CATALOGUE, compute_sales.stream_ndjson(str(sales)))
+    actual = compute_sales.polars_receipt(CATALOGUE, str(sales))
+    assert report(actual) == report(expected)
+
+
+@pytest.mark.parametrize(
+    "case", ["aliases", "late_alias", "first_record_key", "numeric_only"])
+def test_ndjson_uses_polars(tmp_path, case):
+    """Archivos sin valores ambiguos se resuelven en polars."""
+    sales = write_sales(tmp_path, case)
+    assert compute_sales.polars_rows(CATALOGUE, str(sales)) is not None